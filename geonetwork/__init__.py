@@ -1,5 +1,8 @@
 from typing import List
 from .gn_api import GnApi
+from .gn_cluster import GnClusterApi
+from .gn_export import export_records
+from .gn_manifest import RecordManifest
 from .gn_session import GnSession
 
-__all__: List[str] = ["GnApi", "GnSession"]
+__all__: List[str] = ["GnApi", "GnClusterApi", "RecordManifest", "export_records", "GnSession"]
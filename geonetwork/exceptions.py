@@ -42,13 +42,23 @@ class ParameterException(GnException):
 class GnElasticException(GnException):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.detail.info = format_ES_error(self.parent_response.json())
+        try:
+            error = self.parent_response.json()
+        except ValueError:
+            # e.g. html page of a gateway error
+            error = {"message": self.parent_response.text}
+        self.detail.info = format_ES_error(error)
 
 
 class GnRequestException(GnException):
     pass
 
 
+class IntegrityException(GnException):
+    def __init__(self, *args, **kwargs):
+        super().__init__(409, *args, **kwargs)
+
+
 def format_ES_error(error: Dict[str, str]) -> Dict[str, Any]:
     error_lines = html.unescape(error.get("message", "")).split("\n")
     result_dict = {}
@@ -1,8 +1,12 @@
 from io import BytesIO
-from typing import Union, Literal, IO, Any, Dict
+from typing import Union, Literal, IO, Any, Dict, List
 from .gn_session import GnSession, Credentials
 from .gn_logger import logger
-from .exceptions import APIVersionException, ParameterException, GnDetail, GnElasticException, raise_for_status
+from .gn_attachments import download_attachments, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_CHUNK_RETRIES
+from .gn_manifest import RecordManifest, ZipRecord, normalized_hash, zip_records
+from .exceptions import (
+    APIVersionException, ParameterException, GnException, GnDetail, GnElasticException, raise_for_status
+)
 
 
 GN_VERSION_RANGE = ["4.2.2", "4.999"]
@@ -39,9 +43,9 @@ class GnApi:
         self.xsrf_token = resp.cookies.get("XSRF-TOKEN", path="/geonetwork")
         self.session.set_base_header("X-XSRF-TOKEN", self.xsrf_token)
 
-    def _get_version(self):
+    def _get_version(self, **kwargs: Any):
         version_url = self.api_url + "/site"
-        resp = self.session.get(version_url)
+        resp = self.session.get(version_url, **kwargs)
         raise_for_status(resp)
         version = resp.json().get("system/platform/version")
         if (
@@ -125,11 +129,95 @@ class GnApi:
             "detail": results,
         }
 
+    def put_record_zip_if_changed(
+        self, zipdata: IO[bytes], manifest: Union[RecordManifest, None] = None, overwrite: bool = True
+    ) -> Any:
+        """
+         upload metadata as a zip archive, unless all its records are unchanged.
+         The hash of each record of the archive (normalized `<uuid>/metadata/metadata.xml` and CRC of
+         the other entries under `<uuid>/`) is compared with the hash stored in `manifest`.
+         Without manifest, only the metadata can be compared with the server copy retrieved by
+         `get_metadataxml`, so records with attached files (`public/`, `private/`) are always uploaded.
+         Skipping the upload avoids a useless reindexing on the server.
+         With `overwrite=False`, every upload creates a new record with a new uuid, so the archive is
+         always uploaded and the manifest is left untouched.
+        :param zipdata: file-like object of the zip file
+        :param manifest: RecordManifest of the previous uploads, updated and saved after a successful upload
+        :param overwrite: boolean [True] overwrite existing data or create a new record with new uuid
+        :returns: dict of the response of `put_record_zip`, or {"msg": ..., "skipped": [uuids]} if nothing changed
+        """
+        if not overwrite:
+            return self.put_record_zip(zipdata, overwrite)
+        records = zip_records(zipdata)
+        if records and all(self._is_record_unchanged(uuid, record, manifest) for uuid, record in records.items()):
+            logger.debug("Records %s unchanged, upload skipped", list(records))
+            return {
+                "msg": f"Metadata unchanged ({', '.join(records)})",
+                "skipped": list(records),
+            }
+        result = self.put_record_zip(zipdata, overwrite)
+        if manifest is not None:
+            manifest.update({uuid: record.hash for uuid, record in records.items()})
+            manifest.save()
+        return result
+
+    def _is_record_unchanged(self, uuid: str, record: ZipRecord, manifest: Union[RecordManifest, None]) -> bool:
+        if manifest is not None:
+            return manifest.get(uuid) == record.hash
+        if record.has_data:
+            logger.debug("Record %s has attached files, cannot compare with the server copy", uuid)
+            return False
+        try:
+            return normalized_hash(self.get_metadataxml(uuid)) == record.metadata_hash
+        except GnException as err:
+            if err.code == 404:
+                return False
+            raise
+
+    def get_attachments(self, uuid: str) -> List[Dict[str, Any]]:
+        """
+         list the attachments (linked resources uploaded to the catalog) of a record.
+        :param uuid: uuid of the metadata
+        :returns: list of dicts including filename, url and size of each attachment
+        """
+        resp = self.session.get(f"{self.api_url}/records/{uuid}/attachments")
+        if resp.status_code == 404:
+            raise ParameterException(
+                code=400,
+                detail=GnDetail(f"UUID {uuid} not found"),
+                parent_request=resp.request,
+                parent_response=resp
+            )
+        raise_for_status(resp)
+        return resp.json()
+
+    def download_attachments(
+        self,
+        uuid: str,
+        dest_dir: str,
+        checksums: Union[Dict[str, str], None] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        retries: int = DEFAULT_CHUNK_RETRIES,
+    ) -> List[str]:
+        """
+         download all attachments of a record to `dest_dir` with parallel Range requests.
+         Interrupted downloads resume from the completed chunks when called again.
+        :param uuid: uuid of the metadata
+        :param dest_dir: directory where the files are written
+        :param checksums: optional dict filename -> expected sha256 hex digest
+        :param chunk_size: size in bytes of each Range request
+        :param max_workers: maximum number of concurrent requests
+        :param retries: number of retries of a failed chunk
+        :returns: list of paths of the downloaded files
+        """
+        return download_attachments(self, uuid, dest_dir, checksums, chunk_size, max_workers, retries)
+
     def get_metadataxml(self, uuid):
         headers = {
             'Accept': 'application/xml',
         }
-        url = self.server + "/records/"+uuid
+        url = self.api_url + "/records/"+uuid
         resp = self.session.get(
             url,
             headers=headers,
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Union
+from urllib.parse import quote
+from requests import Response
+from requests.exceptions import RequestException
+from .gn_logger import logger
+from .exceptions import GnRequestException, GnDetail, IntegrityException, raise_for_status
+
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_CHUNK_RETRIES = 3
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def response_validator(resp: Response) -> Union[str, None]:
+    """
+    strong ETag, or Last-Modified date, identifying the version of the remote file (usable in `If-Range`)
+    """
+    etag = resp.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return resp.headers.get("Last-Modified")
+
+
+class _PartialFile:
+    def __init__(self, path: str, size: int, chunk_size: int):
+        """
+        `<path>.part` file being downloaded, with the completed chunks and the version of the remote
+        file kept in `<path>.part.json` so that an interrupted download resumes where it stopped.
+        """
+        self.path = path
+        self.part_path = path + ".part"
+        self.state_path = path + ".part.json"
+        self.size = size
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.done: List[int] = []
+        self.received = 0
+        self.validator: Union[str, None] = None
+        if os.path.exists(self.part_path) and os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state.get("size") == size and state.get("chunk_size") == chunk_size:
+                self.done = state["done"]
+                self.received = state.get("received", 0)
+                self.validator = state.get("validator")
+        if not self.done:
+            self.received = 0
+            self.validator = None
+            with open(self.part_path, "wb") as f:
+                f.truncate(size)
+
+    @property
+    def pending(self) -> List[int]:
+        n_chunks = -(-self.size // self.chunk_size)
+        return [i for i in range(n_chunks) if i not in self.done]
+
+    def check_validator(self, validator: Union[str, None]):
+        """
+        make sure all chunks come from the same version of the remote file
+        """
+        with self._lock:
+            if self.validator is None:
+                self.validator = validator
+            elif validator is not None and validator != self.validator:
+                raise IntegrityException(
+                    GnDetail(f"{self.path} changed on the server during the download",
+                             {"validator": validator, "expected_validator": self.validator}),
+                )
+
+    def mark_done(self, index: int, length: int):
+        with self._lock:
+            self.done.append(index)
+            self.received += length
+            with open(self.state_path, "w") as f:
+                json.dump({
+                    "size": self.size,
+                    "chunk_size": self.chunk_size,
+                    "validator": self.validator,
+                    "received": self.received,
+                    "done": self.done,
+                }, f)
+
+    def discard(self):
+        for p in (self.part_path, self.state_path):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def complete(self):
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+def _check_content_range(resp: Response, url: str, partial: _PartialFile, start: int, end: int):
+    match = CONTENT_RANGE.fullmatch(resp.headers.get("Content-Range", ""))
+    if match is None or (int(match[1]), int(match[2])) != (start, end):
+        raise GnRequestException(
+            502,
+            GnDetail(f"Unexpected Content-Range {resp.headers.get('Content-Range')} at {url}"),
+            resp.request,
+            resp,
+        )
+    if match[3] != "*" and int(match[3]) != partial.size:
+        raise IntegrityException(
+            GnDetail(f"{url} has {match[3]} bytes on the server, {partial.size} in the attachment list"),
+            resp.request,
+            resp,
+        )
+
+
+def _download_chunk(session: Any, url: str, partial: _PartialFile, index: int, retries: int):
+    start = index * partial.chunk_size
+    end = min(start + partial.chunk_size, partial.size) - 1
+    for attempt in range(retries + 1):
+        headers = {"accept": "*/*", "Range": f"bytes={start}-{end}"}
+        if partial.validator is not None:
+            # the server answers with the whole file instead of the range if it changed
+            headers["If-Range"] = partial.validator
+        try:
+            resp = session.get(url, headers=headers, stream=True)
+            with resp:
+                if resp.status_code == 416:
+                    raise IntegrityException(
+                        GnDetail(f"Range {start}-{end} not satisfiable, {url} shrank on the server"),
+                        resp.request,
+                        resp,
+                    )
+                raise_for_status(resp, exception_class=GnRequestException)
+                if resp.status_code != 206:
+                    if "If-Range" in headers:
+                        raise IntegrityException(
+                            GnDetail(f"{url} changed on the server since the download started"),
+                            resp.request,
+                            resp,
+                        )
+                    raise GnRequestException(
+                        501,
+                        GnDetail(f"Range requests not supported at {url}"),
+                        resp.request,
+                        resp,
+                    )
+                _check_content_range(resp, url, partial, start, end)
+                partial.check_validator(response_validator(resp))
+                written = 0
+                try:
+                    with open(partial.part_path, "r+b") as f:
+                        f.seek(start)
+                        for block in resp.iter_content(BLOCK_SIZE):
+                            f.write(block)
+                            written += len(block)
+                except RequestException as err:
+                    # connection dropped while streaming the body
+                    raise GnRequestException(
+                        504,
+                        GnDetail(f"HTTP error {err.__class__.__name__} while reading {url}", {"error": err}),
+                        resp.request,
+                        resp,
+                    )
+                if written != end - start + 1:
+                    raise GnRequestException(
+                        502,
+                        GnDetail(f"Incomplete chunk {index} at {url}: {written} bytes"),
+                        resp.request,
+                        resp,
+                    )
+            partial.mark_done(index, written)
+            return
+        except GnRequestException as err:
+            if err.code < 500 or err.code == 501 or attempt == retries:
+                raise
+            logger.debug("Chunk %s of %s failed (%s), retrying", index, url, err.detail.message)
+
+
+def download_attachments(
+    gn_api: Any,
+    uuid: str,
+    dest_dir: str,
+    checksums: Union[Dict[str, str], None] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    retries: int = DEFAULT_CHUNK_RETRIES,
+) -> List[str]:
+    """
+    download all attachments of a record to `dest_dir`.
+    Each file is fetched with HTTP Range requests in chunks of `chunk_size` bytes, written directly to disk.
+    The chunks of all files share a pool of `max_workers` threads. Chunks failing on a network error are
+    retried `retries` times; if the download still fails, calling again resumes from the completed chunks,
+    provided the file did not change on the server (checked with `If-Range`).
+    :param gn_api: GnApi instance
+    :param uuid: uuid of the metadata
+    :param dest_dir: directory where the files are written
+    :param checksums: optional dict filename -> expected sha256 hex digest
+    :param chunk_size: size in bytes of each Range request
+    :param max_workers: maximum number of concurrent requests
+    :param retries: number of retries of a failed chunk
+    :returns: list of paths of the downloaded files
+    :raises IntegrityException: size or checksum mismatch, or file changed on the server during the download.
+                                The partial file is discarded, so that calling again starts over
+    """
+    checksums = checksums or {}
+    os.makedirs(dest_dir, exist_ok=True)
+    resources = gn_api.get_attachments(uuid)
+    paths: List[str] = []
+    partials: List[_PartialFile] = []
+    corrupted: Union[_PartialFile, None] = None
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for resource in resources:
+                filename = os.path.basename(resource["filename"])
+                path = os.path.join(dest_dir, filename)
+                paths.append(path)
+                if os.path.exists(path) and os.path.getsize(path) == resource["size"]:
+                    if filename not in checksums or file_sha256(path) == checksums[filename]:
+                        logger.debug("Attachment %s already downloaded", path)
+                        continue
+                partial = _PartialFile(path, resource["size"], chunk_size)
+                partials.append(partial)
+                url = f"{gn_api.api_url}/records/{uuid}/attachments/{quote(filename)}"
+                futures += [
+                    (partial, executor.submit(_download_chunk, gn_api.session, url, partial, index, retries))
+                    for index in partial.pending
+                ]
+            for partial, future in futures:
+                # raises the first chunk error, chunks already queued still complete and are kept for resuming
+                try:
+                    future.result()
+                except IntegrityException:
+                    corrupted = partial
+                    # no point in downloading more of a file that changed
+                    for _, pending in futures:
+                        pending.cancel()
+                    raise
+    except IntegrityException:
+        # the pool is shut down, no chunk is being written anymore
+        if corrupted is not None:
+            corrupted.discard()
+        raise
+    for partial in partials:
+        filename = os.path.basename(partial.path)
+        expected_checksum = checksums.get(filename)
+        if partial.received != partial.size or (
+            expected_checksum is not None and file_sha256(partial.part_path) != expected_checksum
+        ):
+            partial.discard()
+            raise IntegrityException(
+                GnDetail(
+                    f"Attachment {filename} of {uuid} is corrupted",
+                    {"size": partial.received, "expected_size": partial.size, "expected_sha256": expected_checksum},
+                ),
+            )
+        partial.complete()
+        logger.info("Attachment %s downloaded", partial.path)
+    return paths
@@ -0,0 +1,336 @@
+import itertools
+import threading
+import time
+from typing import Union, Literal, IO, Any, Dict, List, Callable
+from .gn_api import GnApi
+from .gn_session import GnSession, Credentials
+from .gn_manifest import RecordManifest
+from .gn_attachments import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_CHUNK_RETRIES
+from .gn_logger import logger
+from .exceptions import GnException, GnRequestException, GnDetail, raise_for_status
+
+
+# status codes for which a read is retried on another node
+RETRYABLE_CODES = [502, 503, 504]
+# (connect, read) timeout of the health checks, short so that a dead node is detected quickly
+HEALTH_CHECK_TIMEOUT = (5, 10)
+# period in seconds of the background thread looking for ejected nodes to check
+HEALTH_CHECK_TICK = 1
+# smoothing factor of the exponentially weighted moving average of latencies
+LATENCY_EWMA_ALPHA = 0.3
+
+Balancing = Literal["least_outstanding", "latency"]
+
+
+class GnNode:
+    def __init__(
+        self,
+        api_url: str,
+        credentials: Union[Credentials, None] = None,
+        verifytls: bool = True,
+    ):
+        """
+        One geonetwork server of a cluster
+
+        The node performs its own handshake (version check and XSRF token) through a dedicated GnApi instance.
+        If the server cannot be reached or answers with a server error (e.g. 503 while starting),
+        the node starts ejected and is handshaked again on the next health check.
+
+        :param api_url: direct url to the geonetwork API of the node, usually ends with `/geonetwork/srv/api`
+        :param credentials: tuple of (login, password)
+        :param verifytls: boolean, default True
+        """
+        self.api_url = api_url
+        self.credentials = credentials
+        self.verifytls = verifytls
+        self.api: Union[GnApi, None] = None
+        self.outstanding = 0
+        self.latency: Union[float, None] = None
+        self.ejected_until = 0.0
+        self.probing = False
+        try:
+            self.connect()
+        except GnException as err:
+            # client errors and unsupported versions (501) are configuration errors, not an unhealthy node
+            if err.code < 500 or err.code == 501:
+                raise
+            logger.warning("Node %s unavailable during handshake: %s", api_url, err.detail.message)
+
+    def connect(self):
+        """
+        Perform the handshake with the node and mark it healthy
+        """
+        self.api = GnApi(self.api_url, self.credentials, self.verifytls)
+        self.ejected_until = 0.0
+
+    def check_health(self) -> bool:
+        """
+        Query `/site` on the node with a short timeout (and handshake again if it never succeeded)
+        :returns: True if the node answered with a supported version
+        """
+        try:
+            if self.api is None:
+                with GnSession(self.credentials, self.verifytls) as session:
+                    raise_for_status(session.get(self.api_url + "/site", timeout=HEALTH_CHECK_TIMEOUT))
+                self.connect()
+            else:
+                self.api._get_version(timeout=HEALTH_CHECK_TIMEOUT)
+        except GnException as err:
+            logger.debug("Health check failed for %s: %s", self.api_url, err.detail.message)
+            return False
+        return True
+
+    def is_available(self, now: float) -> bool:
+        return self.api is not None and self.ejected_until <= now
+
+    def record_latency(self, elapsed: float):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = LATENCY_EWMA_ALPHA * elapsed + (1 - LATENCY_EWMA_ALPHA) * self.latency
+
+    def close_session(self):
+        if self.api is not None:
+            self.api.close_session()
+
+
+class GnClusterApi:
+    def __init__(
+        self,
+        api_urls: List[str],
+        credentials: Union[Credentials, None] = None,
+        verifytls: bool = True,
+        balancing: Balancing = "least_outstanding",
+        health_check_interval: float = 30,
+    ):
+        """
+        Initialize a GnClusterApi object spreading calls over several geonetwork nodes
+
+        Every node gets its own handshake and XSRF token (see GnApi).
+        - read operations are routed to the available node with the least outstanding requests,
+          or with the lowest latency weighted by its outstanding requests (`balancing="latency"`)
+        - read operations failing with a network or gateway error are retried on another node
+        - write operations are always sent to the primary node, the first of `api_urls`
+        - a node failing with a network or gateway error is ejected for `health_check_interval` seconds,
+          then a background thread checks it again on `/site` before it gets traffic back.
+          Call `close_session` to stop this thread
+
+        :param api_urls: list of direct urls to the geonetwork API of each node, the first one is the primary
+        :param credentials: tuple of (login, password), shared by all nodes
+        :param verifytls: boolean, default True
+        :param balancing: "least_outstanding" (default) or "latency"
+        :param health_check_interval: number of seconds an unhealthy node stays ejected before the next check
+        """
+        if not api_urls:
+            raise ValueError("GnClusterApi requires at least one api url")
+        if balancing not in ("least_outstanding", "latency"):
+            raise ValueError(f"Unknown balancing strategy {balancing}")
+        self.balancing = balancing
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._tie_breaker = itertools.count()
+        self.nodes = [GnNode(url, credentials, verifytls) for url in api_urls]
+        for node in self.nodes:
+            if node.api is None:
+                node.ejected_until = time.monotonic() + health_check_interval
+        if all(node.api is None for node in self.nodes):
+            raise GnRequestException(
+                504,
+                GnDetail("No geonetwork node reachable", {"api_urls": api_urls}),
+            )
+        self._stop_health_checks = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, name="gn-health-check", daemon=True)
+        self._health_thread.start()
+
+    @property
+    def primary(self) -> GnNode:
+        return self.nodes[0]
+
+    def check_health(self):
+        """
+        Check all ejected nodes whose ejection delay expired and put the healthy ones back in rotation
+        """
+        now = time.monotonic()
+        for node in self.nodes:
+            if node.ejected_until and node.ejected_until <= now:
+                self._probe(node)
+
+    def _probe(self, node: GnNode) -> Union[bool, None]:
+        """
+        check the health of `node` and update its ejection
+        :returns: True if healthy, False if not, None if another caller is already probing it
+        """
+        with self._lock:
+            # only one caller probes a given node at a time
+            if node.probing:
+                return None
+            node.probing = True
+        healthy = False
+        try:
+            healthy = node.check_health()
+        finally:
+            with self._lock:
+                node.probing = False
+                if healthy:
+                    if node.ejected_until:
+                        logger.info("Node %s back in rotation", node.api_url)
+                    node.ejected_until = 0.0
+                else:
+                    node.ejected_until = time.monotonic() + self.health_check_interval
+        return healthy
+
+    def _health_loop(self):
+        while not self._stop_health_checks.wait(HEALTH_CHECK_TICK):
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("Health check loop failed")
+
+    def _eject(self, node: GnNode):
+        logger.warning("Ejecting node %s for %s s", node.api_url, self.health_check_interval)
+        node.ejected_until = time.monotonic() + self.health_check_interval
+
+    def _node_weight(self, node: GnNode, default_latency: Union[float, None] = None) -> float:
+        if self.balancing == "latency":
+            latency = node.latency if node.latency is not None else default_latency
+            if latency is not None:
+                return latency * (node.outstanding + 1)
+        return node.outstanding
+
+    def _pick_node(self, excluded: List[GnNode]) -> Union[GnNode, None]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [n for n in self.nodes if n.is_available(now) and n not in excluded]
+            if not candidates:
+                return None
+            # rotate the candidates so that ties are spread among nodes
+            offset = next(self._tie_breaker) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+            # nodes without latency sample yet are weighted with the mean latency of the others
+            latencies = [n.latency for n in self.nodes if n.latency is not None]
+            default_latency = sum(latencies) / len(latencies) if latencies else None
+            node = min(candidates, key=lambda n: self._node_weight(n, default_latency))
+            node.outstanding += 1
+            return node
+
+    def _call(self, node: GnNode, operation: Callable[[GnApi], Any]) -> Any:
+        start = time.monotonic()
+        try:
+            result = operation(node.api)
+        except GnException as err:
+            if err.code in RETRYABLE_CODES:
+                self._eject(node)
+            raise
+        finally:
+            with self._lock:
+                node.outstanding -= 1
+        node.record_latency(time.monotonic() - start)
+        return result
+
+    def _read(self, operation: Callable[[GnApi], Any]) -> Any:
+        tried: List[GnNode] = []
+        last_error: Union[GnException, None] = None
+        while True:
+            node = self._pick_node(tried)
+            if node is None:
+                break
+            tried.append(node)
+            try:
+                return self._call(node, operation)
+            except GnException as err:
+                if err.code not in RETRYABLE_CODES:
+                    raise
+                logger.debug("Read failed on %s, trying another node", node.api_url)
+                last_error = err
+        if last_error is not None:
+            raise last_error
+        raise GnRequestException(504, GnDetail("No geonetwork node available"))
+
+    def _write(self, operation: Callable[[GnApi], Any]) -> Any:
+        node = self.primary
+        if node.api is None and not self._probe(node):
+            raise GnRequestException(504, GnDetail(f"Primary node {node.api_url} unreachable"))
+        with self._lock:
+            node.outstanding += 1
+        return self._call(node, operation)
+
+    def get_record_zip(self, uuid: str) -> IO[bytes]:
+        """
+        see GnApi.get_record_zip, routed to any available node
+        """
+        return self._read(lambda api: api.get_record_zip(uuid))
+
+    def get_metadataxml(self, uuid):
+        """
+        see GnApi.get_metadataxml, routed to any available node
+        """
+        return self._read(lambda api: api.get_metadataxml(uuid))
+
+    def get_attachments(self, uuid: str) -> List[Dict[str, Any]]:
+        """
+        see GnApi.get_attachments, routed to any available node
+        """
+        return self._read(lambda api: api.get_attachments(uuid))
+
+    def download_attachments(
+        self,
+        uuid: str,
+        dest_dir: str,
+        checksums: Union[Dict[str, str], None] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        retries: int = DEFAULT_CHUNK_RETRIES,
+    ) -> List[str]:
+        """
+        see GnApi.download_attachments, routed to any available node.
+        A retried download resumes from the chunks completed on the failed node
+        """
+        return self._read(
+            lambda api: api.download_attachments(uuid, dest_dir, checksums, chunk_size, max_workers, retries)
+        )
+
+    def get_thesaurus_dict(self):
+        """
+        see GnApi.get_thesaurus_dict, routed to any available node
+        """
+        return self._read(lambda api: api.get_thesaurus_dict())
+
+    def search(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        see GnApi.search, routed to any available node
+        """
+        return self._read(lambda api: api.search(query))
+
+    def put_record_zip(self, zipdata: IO[bytes], overwrite: bool = True) -> Any:
+        """
+        see GnApi.put_record_zip, sent to the primary node
+        """
+        return self._write(lambda api: api.put_record_zip(zipdata, overwrite))
+
+    def put_record_zip_if_changed(
+        self, zipdata: IO[bytes], manifest: Union[RecordManifest, None] = None, overwrite: bool = True
+    ) -> Any:
+        """
+        see GnApi.put_record_zip_if_changed, sent to the primary node
+        """
+        return self._write(lambda api: api.put_record_zip_if_changed(zipdata, manifest, overwrite))
+
+    def upload_metadata(
+        self, metadata, groupid='100', uuidprocessing: GnApi.UuidProcs = "GENERATEUUID", publish=False
+    ):
+        """
+        see GnApi.upload_metadata, sent to the primary node
+        """
+        return self._write(lambda api: api.upload_metadata(metadata, groupid, uuidprocessing, publish))
+
+    def delete_thesaurus_dict(self, name):
+        """
+        see GnApi.delete_thesaurus_dict, sent to the primary node
+        """
+        return self._write(lambda api: api.delete_thesaurus_dict(name))
+
+    def close_session(self):
+        self._stop_health_checks.set()
+        self._health_thread.join()
+        for node in self.nodes:
+            node.close_session()
@@ -0,0 +1,243 @@
+import csv
+import json
+import os
+from typing import Any, Callable, Dict, IO, Iterator, List, Literal, Union
+from .gn_logger import logger
+
+
+DEFAULT_BATCH_SIZE = 1000
+# search_after needs a total order, uuid is unique for each record
+DEFAULT_SORT = [{"uuid": "asc"}]
+LIST_SEPARATOR = "|"
+
+ExportFormat = Literal["ndjson", "csv", "parquet"]
+FieldMapping = Dict[str, Union[str, Callable[[Dict[str, Any]], Any]]]
+
+
+def iter_hits(
+    gn_api: Any, query: Dict[str, Any], batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    page through `/search/records/_search` with `search_after`, one page of hits at a time.
+    Unlike `from`/`size` paging, this is not limited to the first 10000 hits.
+    :param gn_api: GnApi or GnClusterApi instance
+    :param query: elasticsearch query body, `from`, `size` and `search_after` are managed here.
+                  Without `sort`, hits are sorted by uuid
+    :param batch_size: number of hits per page
+    :returns: iterator of lists of hits
+    """
+    body = {key: value for key, value in query.items() if key not in ("from", "size", "search_after")}
+    body.setdefault("sort", DEFAULT_SORT)
+    body["size"] = batch_size
+    while True:
+        hits = gn_api.search(body)["hits"]["hits"]
+        if not hits:
+            return
+        yield hits
+        if len(hits) < batch_size:
+            return
+        body["search_after"] = hits[-1]["sort"]
+
+
+def _resolve(value: Any, keys: List[str]) -> Any:
+    for i, key in enumerate(keys):
+        if isinstance(value, list):
+            values = [_resolve(v, keys[i:]) for v in value]
+            return [v for v in values if v is not None]
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class HitFlattener:
+    def __init__(self, fields: FieldMapping):
+        """
+        Turn the nested `_source` of search hits into flat rows
+
+        :param fields: dict column name -> dotted path in `_source` (e.g. "resourceTitleObject.default")
+                       or callable taking the `_source` dict. Lists met along a path are mapped element-wise,
+                       e.g. "tag.default" gives the list of all tag labels
+        """
+        self.columns = list(fields)
+        self.getters: List[Callable[[Dict[str, Any]], Any]] = []
+        # top-level `_source` fields to request, None if a callable may read any field
+        self.source_includes: Union[List[str], None] = []
+        for spec in fields.values():
+            if callable(spec):
+                self.getters.append(spec)
+                self.source_includes = None
+            else:
+                keys = spec.split(".")
+                self.getters.append(lambda source, keys=keys: _resolve(source, keys))
+                if self.source_includes is not None and keys[0] not in self.source_includes:
+                    self.source_includes.append(keys[0])
+
+    def __call__(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        columns = self.columns
+        getters = self.getters
+        return [
+            dict(zip(columns, [getter(hit.get("_source", {})) for getter in getters]))
+            for hit in hits
+        ]
+
+
+class NdjsonWriter:
+    def __init__(self, f: IO[str], columns: List[str]):
+        self.f = f
+
+    def write_batch(self, rows: List[Dict[str, Any]]):
+        self.f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        pass
+
+
+class CsvWriter:
+    def __init__(self, f: IO[str], columns: List[str]):
+        self.writer = csv.DictWriter(f, fieldnames=columns)
+        self.writer.writeheader()
+
+    def write_batch(self, rows: List[Dict[str, Any]]):
+        self.writer.writerows(
+            {
+                key: LIST_SEPARATOR.join(str(v) for v in value) if isinstance(value, list) else value
+                for key, value in row.items()
+            }
+            for row in rows
+        )
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    def __init__(self, path: str, columns: List[str], column_types: Union[Dict[str, Any], None] = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("parquet export requires pyarrow, install with `pip install geonetwork[export]`")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.column_types = column_types or {}
+        self.schema = None
+        self.writer = None
+
+    def _infer_schema(self, rows: List[Dict[str, Any]]):
+        # elasticsearch fields may be missing or hold a scalar in one hit and a list in another,
+        # so untyped columns are strings, or lists of strings if multi-valued in the first batch
+        return self.pa.schema([
+            (
+                name,
+                self.column_types.get(name) or (
+                    self.pa.list_(self.pa.string())
+                    if any(isinstance(row[name], list) for row in rows)
+                    else self.pa.string()
+                ),
+            )
+            for name in self.columns
+        ])
+
+    def _coerce(self, name: str, value: Any, pa_type: Any) -> Any:
+        if value is None:
+            return None
+        if self.pa.types.is_list(pa_type):
+            values = value if isinstance(value, list) else [value]
+            return [self._coerce(name, v, pa_type.value_type) for v in values]
+        if self.pa.types.is_string(pa_type):
+            if isinstance(value, list):
+                return LIST_SEPARATOR.join(str(v) for v in value)
+            if isinstance(value, dict):
+                return json.dumps(value, ensure_ascii=False)
+            return str(value)
+        if isinstance(value, list):
+            # single-valued field given as a list
+            if len(value) > 1:
+                raise ValueError(f"Column {name} of type {pa_type} got multiple values {value}")
+            if not value:
+                return None
+            value = value[0]
+        try:
+            if self.pa.types.is_integer(pa_type):
+                return int(value)
+            if self.pa.types.is_floating(pa_type):
+                return float(value)
+            if self.pa.types.is_boolean(pa_type) and isinstance(value, str):
+                return value.lower() in ("true", "y", "yes", "1")
+        except (TypeError, ValueError):
+            raise ValueError(f"Column {name} of type {pa_type} got invalid value {value!r}")
+        return value
+
+    def write_batch(self, rows: List[Dict[str, Any]]):
+        if self.writer is None:
+            self.schema = self._infer_schema(rows)
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        columns = {
+            f.name: [self._coerce(f.name, row[f.name], f.type) for row in rows]
+            for f in self.schema
+        }
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # no hit, write a valid file with the columns only
+            self.writer = self.pq.ParquetWriter(self.path, self._infer_schema([]))
+        self.writer.close()
+
+
+def export_records(
+    gn_api: Any,
+    query: Dict[str, Any],
+    fields: FieldMapping,
+    path: str,
+    format: ExportFormat = "ndjson",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    column_types: Union[Dict[str, Any], None] = None,
+) -> int:
+    """
+    export all hits of a search to a file, flattened according to `fields`.
+    Pages are fetched, flattened and written one at a time, so memory use depends on `batch_size` only.
+    The file is written to `<path>.tmp` and renamed to `path` only when the export succeeds.
+    :param gn_api: GnApi or GnClusterApi instance
+    :param query: elasticsearch query body, see `iter_hits`. Without `_source`, only the fields used by `fields` are requested
+    :param fields: dict column name -> dotted path in `_source` or callable, see `HitFlattener`
+    :param path: output file
+    :param format: "ndjson" (default), "csv" (lists joined with "|") or "parquet" (requires pyarrow)
+    :param batch_size: number of hits per page and per written batch
+    :param column_types: parquet only, dict column name -> pyarrow type. Values are coerced to the type
+                         (scalars wrapped in lists, single-element lists unwrapped). Other columns are strings,
+                         or lists of strings if multi-valued in the first batch
+    :returns: number of exported records
+    """
+    flatten = HitFlattener(fields)
+    if "_source" not in query and flatten.source_includes is not None:
+        query = {**query, "_source": flatten.source_includes}
+    tmp_path = path + ".tmp"
+    count = 0
+    f = None
+    if format == "parquet":
+        writer = ParquetWriter(tmp_path, flatten.columns, column_types)
+    elif format in ("ndjson", "csv"):
+        f = open(tmp_path, "w", newline="" if format == "csv" else None, encoding="utf-8")
+        writer = (CsvWriter if format == "csv" else NdjsonWriter)(f, flatten.columns)
+    else:
+        raise ValueError(f"Unknown export format {format}")
+    try:
+        try:
+            for hits in iter_hits(gn_api, query, batch_size):
+                writer.write_batch(flatten(hits))
+                count += len(hits)
+                logger.debug("Exported %s records to %s", count, path)
+        finally:
+            writer.close()
+            if f is not None:
+                f.close()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import IO, Dict, Tuple, Union
+from xml.etree.ElementTree import canonicalize, ParseError
+from zipfile import ZipFile, BadZipFile
+from .exceptions import ParameterException, GnDetail
+
+
+METADATA_SUFFIX = "/metadata/metadata.xml"
+DATA_DIRS = ["public", "private"]
+
+
+def normalized_hash(xml: Union[bytes, str]) -> str:
+    """
+    sha256 of the canonical form (C14N 2.0) of a metadata document.
+    Whitespace between elements, comments, attribute order and namespace prefixes layout
+    do not change the hash.
+    :param xml: metadata document
+    :returns: hex digest
+    """
+    canonical = canonicalize(xml, strip_text=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ZipRecord:
+    metadata_hash: str
+    # other entries of the record in the archive (info.xml, attached files...), name -> (crc, size)
+    files: Dict[str, Tuple[int, int]] = field(default_factory=lambda: {})
+
+    @property
+    def hash(self) -> str:
+        """
+        hash of the metadata and of all other entries of the record
+        """
+        h = hashlib.sha256(self.metadata_hash.encode())
+        for name in sorted(self.files):
+            crc, size = self.files[name]
+            h.update(f"\n{name}:{crc:08x}:{size}".encode())
+        return h.hexdigest()
+
+    @property
+    def has_data(self) -> bool:
+        """
+        True if the archive contains attached files of the record (`<uuid>/public/` or `<uuid>/private/`)
+        """
+        return any(name.split("/")[1] in DATA_DIRS for name in self.files)
+
+
+def zip_records(zipdata: IO[bytes]) -> Dict[str, ZipRecord]:
+    """
+    describe every record of a zip archive as exported by geonetwork: normalized hash of
+    `<uuid>/metadata/metadata.xml` and CRC of the other entries under `<uuid>/`.
+    The stream position is restored afterwards.
+    :param zipdata: file-like object of the zip file
+    :returns: dict uuid -> ZipRecord
+    """
+    position = zipdata.tell()
+    try:
+        with ZipFile(zipdata) as zf:
+            records = {
+                info.filename[:-len(METADATA_SUFFIX)]: ZipRecord(normalized_hash(zf.read(info)))
+                for info in zf.infolist()
+                if info.filename.endswith(METADATA_SUFFIX)
+            }
+            for info in zf.infolist():
+                uuid = info.filename.split("/")[0]
+                if uuid in records and not info.filename.endswith(METADATA_SUFFIX) and not info.is_dir():
+                    records[uuid].files[info.filename] = (info.CRC, info.file_size)
+            return records
+    except (BadZipFile, ParseError) as err:
+        raise ParameterException(
+            code=400,
+            detail=GnDetail(f"Invalid metadata zip archive: {err}"),
+        )
+    finally:
+        zipdata.seek(position)
+
+
+def zip_record_hashes(zipdata: IO[bytes]) -> Dict[str, str]:
+    """
+    compute the hash of every record of a zip archive, covering the metadata and the other entries
+    of the record (info.xml, thumbnails, attached data...), see `zip_records`.
+    :param zipdata: file-like object of the zip file
+    :returns: dict uuid -> hash
+    """
+    return {uuid: record.hash for uuid, record in zip_records(zipdata).items()}
+
+
+class RecordManifest:
+    def __init__(self, path: str):
+        """
+        Locally persisted map uuid -> normalized hash of the last uploaded version of each record
+        :param path: json file, created on first save
+        """
+        self.path = path
+        self.hashes: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.hashes = json.load(f)
+
+    def get(self, uuid: str) -> Union[str, None]:
+        return self.hashes.get(uuid)
+
+    def update(self, hashes: Dict[str, str]):
+        self.hashes.update(hashes)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.hashes, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,30 @@
+import pytest
+from zipfile import ZipFile
+from io import BytesIO
+import requests_mock
+from geonetwork import GnApi
+
+
+@pytest.fixture
+def init_gn():
+    with requests_mock.Mocker() as m:
+        cookies = requests_mock.CookieJar()
+        cookies.set("XSRF-TOKEN", "dummy_xsrf", path="/geonetwork")
+
+        def site_callback(request, context):
+            assert request.headers.get("accept") == "application/json"
+            return {"system/platform/version": "4.3.2"}
+        m.get('http://geonetwork/api/site', json=site_callback, cookies=cookies)
+        gn = GnApi("http://geonetwork/api")
+        return gn
+
+
+@pytest.fixture
+def zipdata():
+    zz = BytesIO()
+    with ZipFile(zz, "w") as zf:
+        with zf.open("index.csv", "w") as ii:
+            ii.write(b'"schema";"uuid";"id";"type";"isHarvested";"title";"abstract"\n"iso19139";"859ebc17-6811-48f6-a7ef-b9a29ad94f95";"39636";"METADATA";"true";"-";"-"\n')
+        with zf.open("859ebc17-6811-48f6-a7ef-b9a29ad94f95/metadata/metadata.xml", "w") as xx:  
+            xx.write(b"<dummy><xml></xml></dummy>")
+    return zz
@@ -3,35 +3,10 @@ from zipfile import ZipFile
 from io import BytesIO
 from requests.exceptions import HTTPError
 import requests_mock
-from geonetwork import GnApi
+from geonetwork import GnApi, RecordManifest
 from geonetwork.exceptions import APIVersionException, ParameterException, AuthException, GnException, GnElasticException
 
 
-@pytest.fixture
-def init_gn():
-    with requests_mock.Mocker() as m:
-        cookies = requests_mock.CookieJar()
-        cookies.set("XSRF-TOKEN", "dummy_xsrf", path="/geonetwork")
-
-        def site_callback(request, context):
-            assert request.headers.get("accept") == "application/json"
-            return {"system/platform/version": "4.3.2"}
-        m.get('http://geonetwork/api/site', json=site_callback, cookies=cookies)
-        gn = GnApi("http://geonetwork/api")
-        return gn
-
-
-@pytest.fixture
-def zipdata():
-    zz = BytesIO()
-    with ZipFile(zz, "w") as zf:
-        with zf.open("index.csv", "w") as ii:
-            ii.write(b'"schema";"uuid";"id";"type";"isHarvested";"title";"abstract"\n"iso19139";"859ebc17-6811-48f6-a7ef-b9a29ad94f95";"39636";"METADATA";"true";"-";"-"\n')
-        with zf.open("859ebc17-6811-48f6-a7ef-b9a29ad94f95/metadata/metadata.xml", "w") as xx:  
-            xx.write(b"<dummy><xml></xml></dummy>")
-    return zz
-
-
 def test_init(init_gn):
     assert init_gn.xsrf_token == "dummy_xsrf"
 
@@ -139,6 +114,78 @@ def test_upload_zip_fail(init_gn):
         ]
 
 
+def test_upload_zip_if_changed_manifest(init_gn, zipdata, tmp_path):
+    manifest = RecordManifest(str(tmp_path / "manifest.json"))
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/records', json={"errors": [], "metadataInfos": {101: [{"uuid": 101}]}})
+        m.get('http://geonetwork/api/records/101', json={
+            "gmd:fileIdentifier": {"gco:CharacterString": {"#text": "859ebc17-6811-48f6-a7ef-b9a29ad94f95"}}
+        })
+        resp = init_gn.put_record_zip_if_changed(zipdata, manifest)
+        assert resp["msg"] == "Metadata creation successful (859ebc17-6811-48f6-a7ef-b9a29ad94f95)"
+        assert m.call_count == 2
+        resp = init_gn.put_record_zip_if_changed(zipdata, RecordManifest(str(tmp_path / "manifest.json")))
+        assert resp["skipped"] == ["859ebc17-6811-48f6-a7ef-b9a29ad94f95"]
+        assert m.call_count == 2
+
+
+def test_upload_zip_if_changed_server(init_gn, zipdata):
+    with requests_mock.Mocker() as m:
+        def xml_callback(request, context):
+            assert request.headers.get("accept") == "application/xml"
+            return b"<dummy>\n  <xml/>\n</dummy>"
+        m.get('http://geonetwork/api/records/859ebc17-6811-48f6-a7ef-b9a29ad94f95', content=xml_callback)
+        resp = init_gn.put_record_zip_if_changed(zipdata)
+        assert resp["skipped"] == ["859ebc17-6811-48f6-a7ef-b9a29ad94f95"]
+        assert m.call_count == 1
+
+
+def test_upload_zip_if_changed_attached_file(init_gn, zipdata, tmp_path):
+    manifest = RecordManifest(str(tmp_path / "manifest.json"))
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/records', json={"errors": [], "metadataInfos": {101: [{"uuid": 101}]}})
+        m.get('http://geonetwork/api/records/101', json={
+            "gmd:fileIdentifier": {"gco:CharacterString": {"#text": "859ebc17-6811-48f6-a7ef-b9a29ad94f95"}}
+        })
+        init_gn.put_record_zip_if_changed(zipdata, manifest)
+        with ZipFile(zipdata, "a") as zf:
+            zf.writestr("859ebc17-6811-48f6-a7ef-b9a29ad94f95/public/thumbnail.png", b"png")
+        resp = init_gn.put_record_zip_if_changed(zipdata, manifest)
+        assert "skipped" not in resp
+        assert m.call_count == 4
+        # without manifest, attached files cannot be compared with the server copy
+        resp = init_gn.put_record_zip_if_changed(zipdata)
+        assert "skipped" not in resp
+        assert m.call_count == 6
+
+
+def test_upload_zip_if_changed_generate_uuid(init_gn, zipdata, tmp_path):
+    manifest = RecordManifest(str(tmp_path / "manifest.json"))
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/records', json={"errors": [], "metadataInfos": {101: [{"uuid": 101}]}})
+        m.get('http://geonetwork/api/records/101', json={
+            "gmd:fileIdentifier": {"gco:CharacterString": {"#text": "new-uuid"}}
+        })
+        for _ in range(2):
+            resp = init_gn.put_record_zip_if_changed(zipdata, manifest, overwrite=False)
+            assert resp["msg"] == "Metadata creation successful (new-uuid)"
+        assert m.call_count == 4
+        assert "uuidProcessing=GENERATEUUID" in m.request_history[0].url
+    assert manifest.hashes == {}
+
+
+def test_upload_zip_if_changed_new_record(init_gn, zipdata):
+    with requests_mock.Mocker() as m:
+        m.get('http://geonetwork/api/records/859ebc17-6811-48f6-a7ef-b9a29ad94f95', status_code=404)
+        m.post('http://geonetwork/api/records', json={"errors": [], "metadataInfos": {101: [{"uuid": 101}]}})
+        m.get('http://geonetwork/api/records/101', json={
+            "gmd:fileIdentifier": {"gco:CharacterString": {"#text": "859ebc17-6811-48f6-a7ef-b9a29ad94f95"}}
+        })
+        resp = init_gn.put_record_zip_if_changed(zipdata)
+        assert "skipped" not in resp
+        assert m.request_history[1].method == "POST"
+
+
 def test_search(init_gn):
     QUERY_TEXT = (
         '{"query": {"bool": {"must": [{"terms": {"isTemplate": ["n"]}}, '
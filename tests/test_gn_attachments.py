@@ -0,0 +1,198 @@
+import hashlib
+import io
+import json
+import os
+import re
+import pytest
+import requests_mock
+from requests.exceptions import ReadTimeout
+from urllib3.exceptions import ProtocolError
+from geonetwork import GnClusterApi
+from geonetwork.exceptions import GnRequestException, IntegrityException, ParameterException
+
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+ATTACHMENT_URL = "http://geonetwork/api/records/1234/attachments/big%20file.bin"
+
+
+def mock_attachments(m, data=DATA, fail_ranges=(), etag='"v1"', api_url="http://geonetwork/api"):
+    m.get(f"{api_url}/records/1234/attachments", json=[
+        {"filename": "big file.bin", "size": len(DATA), "url": ATTACHMENT_URL},
+        {"filename": "empty.txt", "size": 0, "url": f"{api_url}/records/1234/attachments/empty.txt"},
+    ])
+
+    def range_callback(request, context):
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", request.headers["Range"]).groups())
+        if start in fail_ranges:
+            raise ReadTimeout
+        context.headers["ETag"] = etag
+        if request.headers.get("If-Range", etag) != etag:
+            return data
+        context.status_code = 206
+        context.headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return data[start:end + 1]
+    m.get(f"{api_url}/records/1234/attachments/big%20file.bin", content=range_callback)
+
+
+class DroppedBody(io.RawIOBase):
+    """
+    response body losing the connection after `length` bytes
+    """
+    def __init__(self, data, length):
+        self.data = io.BytesIO(data[:length])
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        block = self.data.read(size)
+        if not block:
+            raise ProtocolError("Connection broken: IncompleteRead")
+        return block
+
+
+def test_get_attachments(init_gn):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        assert [a["filename"] for a in init_gn.get_attachments("1234")] == ["big file.bin", "empty.txt"]
+        m.get("http://geonetwork/api/records/1232/attachments", status_code=404)
+        with pytest.raises(ParameterException) as err:
+            init_gn.get_attachments("1232")
+        assert err.value.code == 400
+
+
+def test_download(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        paths = init_gn.download_attachments(
+            "1234", str(tmp_path), checksums={"big file.bin": hashlib.sha256(DATA).hexdigest()}, chunk_size=1000
+        )
+        assert m.call_count == 1 + 11
+        assert all("Range" in r.headers for r in m.request_history[1:])
+    assert paths == [str(tmp_path / "big file.bin"), str(tmp_path / "empty.txt")]
+    assert (tmp_path / "big file.bin").read_bytes() == DATA
+    assert (tmp_path / "empty.txt").read_bytes() == b""
+    assert sorted(os.listdir(tmp_path)) == ["big file.bin", "empty.txt"]
+
+
+def test_download_resume(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, fail_ranges=[3000])
+        with pytest.raises(GnRequestException) as err:
+            init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000, max_workers=1, retries=1)
+        assert err.value.code == 504
+    assert not (tmp_path / "big file.bin").exists()
+    assert (tmp_path / "big file.bin.part").exists()
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000)
+        ranges = [r.headers["Range"] for r in m.request_history[1:]]
+        assert ranges == ["bytes=3000-3999"]
+    assert (tmp_path / "big file.bin").read_bytes() == DATA
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000)
+        assert m.call_count == 1
+
+
+def test_download_checksum_mismatch(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        with pytest.raises(IntegrityException) as err:
+            init_gn.download_attachments("1234", str(tmp_path), checksums={"big file.bin": "0" * 64})
+        assert err.value.code == 409
+    assert not (tmp_path / "big file.bin").exists()
+    assert not (tmp_path / "big file.bin.part").exists()
+
+
+def test_download_no_range_support(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        m.get(ATTACHMENT_URL, content=DATA)
+        with pytest.raises(GnRequestException) as err:
+            init_gn.download_attachments("1234", str(tmp_path))
+        assert err.value.code == 501
+
+
+def test_download_dropped_body_is_retried(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        content_range = {"Content-Range": f"bytes 0-{len(DATA) - 1}/{len(DATA)}"}
+        m.get(ATTACHMENT_URL, [
+            {"status_code": 206, "headers": content_range, "body": DroppedBody(DATA, 1000)},
+            {"status_code": 206, "headers": content_range, "content": DATA},
+        ])
+        init_gn.download_attachments("1234", str(tmp_path), chunk_size=len(DATA))
+        assert m.call_count == 1 + 2
+    assert (tmp_path / "big file.bin").read_bytes() == DATA
+
+
+def test_download_dropped_body_error(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m)
+        m.get(ATTACHMENT_URL, status_code=206, headers={"Content-Range": f"bytes 0-{len(DATA) - 1}/{len(DATA)}"},
+              body=DroppedBody(DATA, 1000))
+        with pytest.raises(GnRequestException) as err:
+            init_gn.download_attachments("1234", str(tmp_path), chunk_size=len(DATA), retries=0)
+        assert err.value.code == 504
+
+
+def test_download_size_changed(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, data=DATA + b"more")
+        with pytest.raises(IntegrityException):
+            init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000, max_workers=1)
+        # remaining chunks are cancelled
+        assert m.call_count < 1 + 11
+    assert not (tmp_path / "big file.bin.part").exists()
+
+
+def test_download_resume_file_changed(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, fail_ranges=[3000])
+        with pytest.raises(GnRequestException):
+            init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000, max_workers=1, retries=0)
+    with open(tmp_path / "big file.bin.part.json") as f:
+        assert json.load(f)["validator"] == '"v1"'
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, etag='"v2"')
+        with pytest.raises(IntegrityException):
+            init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000)
+        assert m.request_history[1].headers["If-Range"] == '"v1"'
+    assert not (tmp_path / "big file.bin.part").exists()
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, etag='"v2"')
+        init_gn.download_attachments("1234", str(tmp_path), chunk_size=1000)
+    assert (tmp_path / "big file.bin").read_bytes() == DATA
+
+
+@pytest.fixture
+def cluster():
+    with requests_mock.Mocker() as m:
+        cookies = requests_mock.CookieJar()
+        cookies.set("XSRF-TOKEN", "dummy_xsrf", path="/geonetwork")
+        for url in ["http://gn1/api", "http://gn2/api"]:
+            m.get(f"{url}/site", json={"system/platform/version": "4.3.2"}, cookies=cookies)
+        gn = GnClusterApi(["http://gn1/api", "http://gn2/api"])
+    yield gn
+    gn.close_session()
+
+
+def test_cluster_download_positional(cluster, tmp_path):
+    cluster.nodes[1].outstanding = 1
+    with requests_mock.Mocker() as m:
+        mock_attachments(m, api_url="http://gn1/api")
+        checksums = {"big file.bin": hashlib.sha256(DATA).hexdigest()}
+        cluster.download_attachments("1234", str(tmp_path), checksums, 1000, 2, 0)
+        assert m.call_count == 1 + 11
+    assert (tmp_path / "big file.bin").read_bytes() == DATA
+
+
+def test_cluster_checksum_mismatch_no_ejection(cluster, tmp_path):
+    with requests_mock.Mocker() as m:
+        for url in ["http://gn1/api", "http://gn2/api"]:
+            mock_attachments(m, api_url=url)
+        with pytest.raises(IntegrityException):
+            cluster.download_attachments("1234", str(tmp_path), {"big file.bin": "0" * 64})
+        assert m.call_count == 2
+    assert all(n.ejected_until == 0 for n in cluster.nodes)
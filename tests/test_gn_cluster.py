@@ -0,0 +1,239 @@
+import time
+import pytest
+from requests.exceptions import ConnectTimeout
+import requests_mock
+from geonetwork import GnClusterApi, gn_cluster
+from geonetwork.exceptions import APIVersionException, GnElasticException, GnRequestException, ParameterException
+
+
+NODES = ["http://gn1/api", "http://gn2/api", "http://gn3/api"]
+
+
+def mock_site(m, api_url, token="dummy_xsrf"):
+    cookies = requests_mock.CookieJar()
+    cookies.set("XSRF-TOKEN", token, path="/geonetwork")
+    m.get(f"{api_url}/site", json={"system/platform/version": "4.3.2"}, cookies=cookies)
+
+
+def raise_timeout(request, context):
+    raise ConnectTimeout
+
+
+@pytest.fixture
+def cluster():
+    with requests_mock.Mocker() as m:
+        for i, url in enumerate(NODES):
+            mock_site(m, url, f"xsrf_{i}")
+        gn = GnClusterApi(NODES)
+    yield gn
+    gn.close_session()
+
+
+def test_init(cluster):
+    assert [n.api.xsrf_token for n in cluster.nodes] == ["xsrf_0", "xsrf_1", "xsrf_2"]
+    assert cluster.primary.api_url == "http://gn1/api"
+
+
+def test_init_partial_failure():
+    with requests_mock.Mocker() as m:
+        mock_site(m, NODES[0])
+        m.get(f"{NODES[1]}/site", content=raise_timeout)
+        gn = GnClusterApi(NODES[:2])
+        assert gn.nodes[0].api is not None
+        assert gn.nodes[1].api is None
+        assert gn.nodes[1].ejected_until > 0
+
+
+def test_init_node_starting():
+    with requests_mock.Mocker() as m:
+        mock_site(m, NODES[0])
+        m.get(f"{NODES[1]}/site", status_code=503)
+        gn = GnClusterApi(NODES[:2])
+        assert gn.nodes[1].api is None
+        assert gn.nodes[1].ejected_until > 0
+
+
+def test_init_unsupported_version():
+    with requests_mock.Mocker() as m:
+        mock_site(m, NODES[0])
+        m.get(f"{NODES[1]}/site", json={"system/platform/version": "0.1.1"})
+        with pytest.raises(APIVersionException):
+            GnClusterApi(NODES[:2])
+
+
+def test_init_all_unreachable():
+    with requests_mock.Mocker() as m:
+        m.get(f"{NODES[0]}/site", content=raise_timeout)
+        with pytest.raises(GnRequestException) as err:
+            GnClusterApi(NODES[:1])
+        assert err.value.code == 504
+
+
+def test_reads_are_balanced(cluster):
+    with requests_mock.Mocker() as m:
+        for url in NODES:
+            m.get(f"{url}/records/1234", content=url.encode())
+        served = {cluster.get_record_zip("1234").read() for _ in range(3)}
+        assert served == {url.encode() for url in NODES}
+        assert all(n.outstanding == 0 for n in cluster.nodes)
+
+
+def test_least_outstanding(cluster):
+    cluster.nodes[0].outstanding = 2
+    cluster.nodes[2].outstanding = 1
+    with requests_mock.Mocker() as m:
+        m.get(f"{NODES[1]}/records/1234", content=b"gn2")
+        assert cluster.get_record_zip("1234").read() == b"gn2"
+
+
+def test_latency_balancing(cluster):
+    cluster.balancing = "latency"
+    for node, latency in zip(cluster.nodes, [0.5, 0.1, 0.3]):
+        node.latency = latency
+    with requests_mock.Mocker() as m:
+        m.post(f"{NODES[1]}/search/records/_search", json={"hits": "gn2"})
+        assert cluster.search({"query": {}}) == {"hits": "gn2"}
+
+
+def test_latency_balancing_unmeasured_node(cluster):
+    cluster.balancing = "latency"
+    cluster.nodes[0].latency = 0.05
+    cluster.nodes[0].outstanding = 3
+    cluster.nodes[1].latency = 0.05
+    cluster.nodes[1].outstanding = 3
+    # unmeasured, weighted with the mean latency: 0.05 * 2 < 0.05 * 4
+    cluster.nodes[2].outstanding = 1
+    with requests_mock.Mocker() as m:
+        m.post(f"{NODES[2]}/search/records/_search", json={"hits": "gn3"})
+        assert cluster.search({"query": {}}) == {"hits": "gn3"}
+
+
+def test_search_failover_html_gateway_error(cluster):
+    cluster.nodes[2].outstanding = 1
+    with requests_mock.Mocker() as m:
+        m.post(f"{NODES[0]}/search/records/_search", status_code=502, text="<html>Bad Gateway</html>")
+        m.post(f"{NODES[1]}/search/records/_search", status_code=502, text="<html>Bad Gateway</html>")
+        m.post(f"{NODES[2]}/search/records/_search", json={"hits": "gn3"})
+        assert cluster.search({"query": {}}) == {"hits": "gn3"}
+        assert m.call_count == 3
+    assert cluster.nodes[0].ejected_until > 0
+    assert cluster.nodes[1].ejected_until > 0
+
+
+def test_search_html_gateway_error(cluster):
+    with requests_mock.Mocker() as m:
+        for url in NODES:
+            m.post(f"{url}/search/records/_search", status_code=502, text="<html>Bad Gateway</html>")
+        with pytest.raises(GnElasticException) as err:
+            cluster.search({"query": {}})
+        assert err.value.code == 502
+        assert err.value.detail.info == {"info_0": "<html>Bad Gateway</html>"}
+
+
+def test_write_probe_gate(cluster):
+    cluster.nodes[0].api = None
+    cluster.nodes[0].probing = True
+    with requests_mock.Mocker() as m:
+        with pytest.raises(GnRequestException) as err:
+            cluster.delete_thesaurus_dict("local.theme.test")
+        assert err.value.code == 504
+        assert m.call_count == 0
+
+
+def test_read_failover(cluster):
+    cluster.nodes[1].outstanding = 1
+    cluster.nodes[2].outstanding = 2
+    with requests_mock.Mocker() as m:
+        m.get(f"{NODES[0]}/records/1234", content=raise_timeout)
+        m.get(f"{NODES[1]}/records/1234", status_code=503)
+        m.get(f"{NODES[2]}/records/1234", content=b"gn3")
+        assert cluster.get_record_zip("1234").read() == b"gn3"
+    assert cluster.nodes[0].ejected_until > 0
+    assert cluster.nodes[1].ejected_until > 0
+    assert cluster.nodes[2].ejected_until == 0
+
+
+def test_read_no_retry_on_client_error(cluster):
+    with requests_mock.Mocker() as m:
+        for url in NODES:
+            m.get(f"{url}/records/1234", status_code=404)
+        with pytest.raises(ParameterException):
+            cluster.get_record_zip("1234")
+        assert m.call_count == 1
+    assert all(n.ejected_until == 0 for n in cluster.nodes)
+
+
+def test_read_all_nodes_down(cluster):
+    with requests_mock.Mocker() as m:
+        for url in NODES:
+            m.get(f"{url}/records/1234", content=raise_timeout)
+        with pytest.raises(GnRequestException) as err:
+            cluster.get_record_zip("1234")
+        assert err.value.code == 504
+        assert m.call_count == 3
+
+
+def test_health_check_restores_node(cluster):
+    with requests_mock.Mocker() as m:
+        m.get(f"{NODES[0]}/records/1234", content=raise_timeout)
+        m.get(f"{NODES[1]}/records/1234", content=b"gn2")
+        m.get(f"{NODES[2]}/records/1234", content=b"gn3")
+        cluster.get_record_zip("1234")
+        assert cluster.nodes[0].ejected_until > 0
+        # ejection delay elapsed
+        cluster.nodes[0].ejected_until = 1
+        mock_site(m, NODES[0])
+        cluster.check_health()
+        assert cluster.nodes[0].ejected_until == 0
+
+
+def test_health_check_short_timeout(cluster):
+    cluster.nodes[0].ejected_until = 1
+    with requests_mock.Mocker() as m:
+        mock_site(m, NODES[0])
+        cluster.check_health()
+        assert m.request_history[0].timeout == gn_cluster.HEALTH_CHECK_TIMEOUT
+
+
+def test_health_check_single_probe(cluster):
+    cluster.nodes[0].ejected_until = 1
+    cluster.nodes[0].probing = True
+    with requests_mock.Mocker() as m:
+        cluster.check_health()
+        assert m.call_count == 0
+    assert cluster.nodes[0].ejected_until == 1
+
+
+def test_health_check_thread(cluster, monkeypatch):
+    monkeypatch.setattr(gn_cluster, "HEALTH_CHECK_TICK", 0.01)
+    with requests_mock.Mocker() as m:
+        mock_site(m, NODES[0])
+        gn = GnClusterApi(NODES[:1], health_check_interval=0)
+        gn.nodes[0].ejected_until = 1
+        for _ in range(100):
+            if gn.nodes[0].ejected_until == 0:
+                break
+            time.sleep(0.01)
+        gn.close_session()
+    assert gn.nodes[0].ejected_until == 0
+    assert not gn._health_thread.is_alive()
+
+
+def test_health_check_keeps_node_ejected(cluster):
+    cluster.health_check_interval = 0
+    cluster.nodes[0].ejected_until = 1
+    with requests_mock.Mocker() as m:
+        m.get(f"{NODES[0]}/site", status_code=500)
+        cluster.check_health()
+    assert cluster.nodes[0].ejected_until > 1
+
+
+def test_writes_go_to_primary(cluster):
+    cluster.nodes[0].outstanding = 5
+    with requests_mock.Mocker() as m:
+        def delete_callback(request, context):
+            assert request.headers.get("X-XSRF-TOKEN") == "xsrf_0"
+            return {"deleted": True}
+        m.delete(f"{NODES[0]}/registries/vocabularies/local.theme.test", json=delete_callback)
+        assert cluster.delete_thesaurus_dict("local.theme.test") == {"deleted": True}
+    assert cluster.nodes[0].outstanding == 5
@@ -0,0 +1,154 @@
+import csv
+import json
+import pytest
+import requests_mock
+from geonetwork import export_records
+from geonetwork.exceptions import GnElasticException
+from geonetwork.gn_export import HitFlattener, iter_hits
+
+
+HITS = [
+    {
+        "_source": {
+            "uuid": f"uuid-{i}",
+            "resourceTitleObject": {"default": f"title {i}", "langfre": f"titre {i}"},
+            "tag": [{"default": "tag a"}, {"default": "tag b"}] if i % 2 else [],
+        },
+        "sort": [f"uuid-{i}"],
+    }
+    for i in range(5)
+]
+FIELDS = {"uuid": "uuid", "title": "resourceTitleObject.default", "tags": "tag.default"}
+
+
+@pytest.fixture
+def search_mock():
+    with requests_mock.Mocker() as m:
+        def search_callback(request, context):
+            body = request.json()
+            start = 0
+            if "search_after" in body:
+                start = [h["sort"] for h in HITS].index(body["search_after"]) + 1
+            return {"hits": {"hits": HITS[start:start + body["size"]]}}
+        m.post('http://geonetwork/api/search/records/_search', json=search_callback)
+        yield m
+
+
+def test_iter_hits(init_gn, search_mock):
+    pages = list(iter_hits(init_gn, {"query": {}, "from": 40, "size": 3}, batch_size=2))
+    assert [len(p) for p in pages] == [2, 2, 1]
+    bodies = [r.json() for r in search_mock.request_history]
+    assert bodies[0] == {"query": {}, "sort": [{"uuid": "asc"}], "size": 2}
+    assert bodies[2]["search_after"] == ["uuid-3"]
+
+
+def test_iter_hits_exact_pages(init_gn, search_mock):
+    pages = list(iter_hits(init_gn, {"query": {}}, batch_size=5))
+    assert [len(p) for p in pages] == [5]
+    assert search_mock.call_count == 2
+
+
+def test_flattener():
+    flatten = HitFlattener({**FIELDS, "missing": "a.b", "upper": lambda s: s["uuid"].upper()})
+    rows = flatten(HITS[:2])
+    assert rows == [
+        {"uuid": "uuid-0", "title": "title 0", "tags": [], "missing": None, "upper": "UUID-0"},
+        {"uuid": "uuid-1", "title": "title 1", "tags": ["tag a", "tag b"], "missing": None, "upper": "UUID-1"},
+    ]
+    assert flatten.source_includes is None
+    assert HitFlattener(FIELDS).source_includes == ["uuid", "resourceTitleObject", "tag"]
+
+
+def test_export_ndjson(init_gn, search_mock, tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    assert export_records(init_gn, {"query": {}}, FIELDS, path, batch_size=2) == 5
+    assert search_mock.request_history[0].json()["_source"] == ["uuid", "resourceTitleObject", "tag"]
+    with open(path) as f:
+        rows = [json.loads(line) for line in f]
+    assert rows[1] == {"uuid": "uuid-1", "title": "title 1", "tags": ["tag a", "tag b"]}
+    assert len(rows) == 5
+
+
+def test_export_csv(init_gn, search_mock, tmp_path):
+    path = str(tmp_path / "export.csv")
+    assert export_records(init_gn, {"query": {}}, FIELDS, path, format="csv", batch_size=2) == 5
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows[1] == {"uuid": "uuid-1", "title": "title 1", "tags": "tag a|tag b"}
+    assert len(rows) == 5
+
+
+def test_export_parquet(init_gn, search_mock, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "export.parquet")
+    fields = {**FIELDS, "missing": "a.b"}
+    # first batch has no tag at all
+    assert export_records(init_gn, {"query": {}}, fields, path, format="parquet", batch_size=1) == 5
+    table = pq.read_table(path)
+    assert table.column_names == ["uuid", "title", "tags", "missing"]
+    assert table.to_pylist()[1] == {"uuid": "uuid-1", "title": "title 1", "tags": ["tag a", "tag b"], "missing": None}
+
+
+def test_export_unknown_format(init_gn, tmp_path):
+    with pytest.raises(ValueError):
+        export_records(init_gn, {"query": {}}, FIELDS, str(tmp_path / "export.xls"), format="xls")
+
+
+def test_export_parquet_inconsistent_types(init_gn, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    hits = [
+        {"_source": {"uuid": "uuid-0", "format": "csv"}, "sort": ["uuid-0"]},
+        {"_source": {"uuid": "uuid-1", "format": ["csv", "shp"], "scale": 25000}, "sort": ["uuid-1"]},
+        {"_source": {"uuid": "uuid-2", "format": "shp", "scale": ["5000"]}, "sort": ["uuid-2"]},
+    ]
+    fields = {"uuid": "uuid", "format": "format", "scale": "scale", "scale_int": "scale"}
+    path = str(tmp_path / "export.parquet")
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/search/records/_search', [
+            *[{"json": {"hits": {"hits": [h]}}} for h in hits],
+            {"json": {"hits": {"hits": []}}},
+        ])
+        assert export_records(
+            init_gn, {"query": {}}, fields, path, format="parquet", batch_size=1,
+            column_types={"scale_int": pa.int64()},
+        ) == 3
+    assert pq.read_table(path).to_pylist() == [
+        {"uuid": "uuid-0", "format": "csv", "scale": None, "scale_int": None},
+        {"uuid": "uuid-1", "format": "csv|shp", "scale": "25000", "scale_int": 25000},
+        {"uuid": "uuid-2", "format": "shp", "scale": "5000", "scale_int": 5000},
+    ]
+
+
+def test_export_parquet_empty(init_gn, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "export.parquet")
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/search/records/_search', json={"hits": {"hits": []}})
+        assert export_records(init_gn, {"query": {}}, FIELDS, path, format="parquet") == 0
+    assert pq.read_table(path).column_names == ["uuid", "title", "tags"]
+
+
+def test_export_failure_leaves_no_file(init_gn, tmp_path):
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/search/records/_search', [
+            {"json": {"hits": {"hits": HITS[:2]}}},
+            {"status_code": 400, "json": {"message": "Error"}},
+        ])
+        with pytest.raises(GnElasticException):
+            export_records(init_gn, {"query": {}}, FIELDS, str(tmp_path / "export.ndjson"), batch_size=2)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_parquet_invalid_value(init_gn, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    hits = [{"_source": {"uuid": "uuid-0", "scale": [5000, 25000]}, "sort": ["uuid-0"]}]
+    path = str(tmp_path / "export.parquet")
+    with requests_mock.Mocker() as m:
+        m.post('http://geonetwork/api/search/records/_search', json={"hits": {"hits": hits}})
+        with pytest.raises(ValueError, match="Column scale"):
+            export_records(
+                init_gn, {"query": {}}, {"scale": "scale"}, path, format="parquet",
+                column_types={"scale": pa.int64()},
+            )
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,72 @@
+from io import BytesIO
+from zipfile import ZipFile
+import pytest
+from geonetwork import RecordManifest
+from geonetwork.exceptions import ParameterException
+from geonetwork.gn_manifest import ZipRecord, normalized_hash, zip_record_hashes, zip_records
+
+
+def make_zip(records, files=None):
+    zz = BytesIO()
+    with ZipFile(zz, "w") as zf:
+        zf.writestr("index.csv", b'"schema";"uuid"\n')
+        for uuid, xml in records.items():
+            zf.writestr(f"{uuid}/metadata/metadata.xml", xml)
+        for name, data in (files or {}).items():
+            zf.writestr(name, data)
+    zz.seek(0)
+    return zz
+
+
+def test_normalized_hash():
+    reference = normalized_hash(b'<a x="1" y="2"><b>text</b></a>')
+    assert normalized_hash(
+        b'<?xml version="1.0" encoding="UTF-8"?>\n<a y="2"  x="1">\n  <b>text</b>\n  <!-- comment -->\n</a>'
+    ) == reference
+    assert normalized_hash('<a x="1" y="2"><b>text</b></a>') == reference
+    assert normalized_hash(b'<a x="1" y="2"><b>other</b></a>') != reference
+
+
+def test_zip_record_hashes():
+    zipdata = make_zip({"uuid-1": b"<a>1</a>", "uuid-2": b"<a>2</a>"})
+    zipdata.seek(5)
+    hashes = zip_record_hashes(zipdata)
+    assert hashes == {
+        "uuid-1": ZipRecord(normalized_hash(b"<a>1</a>")).hash,
+        "uuid-2": ZipRecord(normalized_hash(b"<a>2</a>")).hash,
+    }
+    assert zipdata.tell() == 5
+
+
+def test_zip_record_hashes_attached_files():
+    records = {"uuid-1": b"<a>1</a>", "uuid-2": b"<a>2</a>"}
+    reference = zip_record_hashes(make_zip(records, {"uuid-1/public/data.csv": b"1;2"}))
+    changed = zip_record_hashes(make_zip(records, {"uuid-1/public/data.csv": b"1;3"}))
+    assert changed["uuid-1"] != reference["uuid-1"]
+    assert changed["uuid-2"] == reference["uuid-2"]
+    assert zip_record_hashes(make_zip(records))["uuid-1"] != reference["uuid-1"]
+
+
+def test_zip_records_has_data():
+    records = zip_records(make_zip(
+        {"uuid-1": b"<a>1</a>", "uuid-2": b"<a>2</a>"},
+        {"uuid-1/info.xml": b"<info/>", "uuid-2/info.xml": b"<info/>", "uuid-2/private/data.bin": b"data"},
+    ))
+    assert list(records["uuid-1"].files) == ["uuid-1/info.xml"]
+    assert not records["uuid-1"].has_data
+    assert records["uuid-2"].has_data
+
+
+def test_zip_record_hashes_invalid():
+    with pytest.raises(ParameterException) as err:
+        zip_record_hashes(BytesIO(b"dummy_zip"))
+    assert err.value.code == 400
+
+
+def test_manifest(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = RecordManifest(path)
+    assert manifest.get("uuid-1") is None
+    manifest.update({"uuid-1": "abc"})
+    manifest.save()
+    assert RecordManifest(path).get("uuid-1") == "abc"